@@ -1,4 +1,4 @@
-import os
+import os, json
 import streamlit as st
 
 st.set_page_config(page_title="Vector DJ", page_icon="🎧", layout="wide")
@@ -26,6 +26,10 @@ feat_ok = os.path.exists(os.path.join(data_dir, "features")) \
     and os.path.isdir(os.path.join(data_dir, "features")) \
         and len(os.listdir(os.path.join(data_dir, "features"))) > 0
 
+gen_path = os.path.join(data_dir, "index", "generation.json")
+generation = json.load(open(gen_path)).get("generation") if os.path.exists(gen_path) else None
+
 st.subheader("Status")
-st.write({"DB": db_ok, "Features": feat_ok, "Index": index_ok})
-st.info("Tip: re-run python build_index.py after adding new music. It's resumable.")
+st.write({"DB": db_ok, "Features": feat_ok, "Index": index_ok, "Index generation": generation})
+st.info("Tip: re-run python build_index.py after adding new music (it's resumable), "
+        "or keep python build_index.py --watch running.")
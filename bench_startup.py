@@ -0,0 +1,74 @@
+import argparse, glob, json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ("faiss", "lightgbm", "librosa", "umap", "pyloudnorm")
+
+# Runs in a fresh interpreter: execute only the script's top-level imports.
+IMPORT_PROBE = """
+import ast, json, sys, time
+src = open(sys.argv[1], encoding="utf-8").read()
+tree = ast.parse(src)
+mod = ast.Module(body=[n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))], type_ignores=[])
+code = compile(mod, sys.argv[1], "exec")
+t0 = time.perf_counter()
+exec(code, {"__name__": "__bench__"})
+dt = time.perf_counter() - t0
+heavy = [m for m in sys.argv[2].split(",") if m in sys.modules]
+print(json.dumps({"import_sec": dt, "heavy": heavy}))
+"""
+
+# Runs in a fresh interpreter: first full render of the script via AppTest.
+RENDER_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2])).run()
+dt = time.perf_counter() - t0
+print(json.dumps({"render_sec": dt, "exceptions": [e.message for e in at.exception]}))
+"""
+
+
+def _probe(code, *argv):
+    out = subprocess.run([sys.executable, "-c", code, *argv], cwd=ROOT,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "probe failed")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cold-start budget check for app.py and every page.")
+    ap.add_argument("--import-budget", type=float, default=1.5, help="seconds for a script's top-level imports")
+    ap.add_argument("--render-budget", type=float, default=5.0, help="seconds for the first render")
+    ap.add_argument("--skip-render", action="store_true", help="only measure imports")
+    args = ap.parse_args()
+
+    targets = [os.path.join(ROOT, "app.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+    failures = []
+    for path in targets:
+        name = os.path.relpath(path, ROOT)
+        imp = _probe(IMPORT_PROBE, path, ",".join(HEAVY))
+        line = f"{name:<32} import {imp['import_sec']:.3f}s"
+        if imp["import_sec"] > args.import_budget:
+            failures.append(f"{name}: imports took {imp['import_sec']:.3f}s > {args.import_budget}s")
+        if imp["heavy"]:
+            failures.append(f"{name}: heavy modules loaded at import: {', '.join(imp['heavy'])}")
+        if not args.skip_render:
+            ren = _probe(RENDER_PROBE, path, str(args.render_budget * 2))
+            line += f"  first render {ren['render_sec']:.3f}s"
+            if ren["render_sec"] > args.render_budget:
+                failures.append(f"{name}: first render took {ren['render_sec']:.3f}s > {args.render_budget}s")
+            if ren["exceptions"]:
+                failures.append(f"{name}: render raised: {ren['exceptions'][0]}")
+        print(line)
+
+    if failures:
+        print("\nBudget exceeded:")
+        for f in failures:
+            print(" -", f)
+        sys.exit(1)
+    print("\nAll scripts within budget.")
+
+
+if __name__ == "__main__":
+    main()
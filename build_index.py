@@ -5,6 +5,25 @@ from recutils.indexer import ingest, build_features, build_faiss_index
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--retry-failed", action="store_true",
+                    help="retry tracks that exhausted their extraction attempts")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--manifest", action="store_true",
+                      help="catalog the library and write sharded work for --worker runs")
+    mode.add_argument("--worker", action="store_true",
+                      help="claim and extract shards from the manifest until none are left")
+    mode.add_argument("--merge", action="store_true",
+                      help="fold finished shards into the feature store and rebuild the index")
+    mode.add_argument("--status", action="store_true", help="show shard progress")
+    mode.add_argument("--dupes", action="store_true", help="only re-run duplicate clustering")
+    mode.add_argument("--watch", action="store_true",
+                      help="keep running and apply library changes incrementally")
+    ap.add_argument("--poll", action="store_true", help="with --watch: poll instead of using inotify")
+    ap.add_argument("--shard-size", type=int, default=500)
+    ap.add_argument("--processes", type=int, default=1, help="local worker processes for --worker")
+    ap.add_argument("--worker-id", default=None)
+    ap.add_argument("--lease-sec", type=float, default=120.0,
+                    help="reclaim a shard whose worker has not heartbeated for this long")
     args = ap.parse_args()
 
     cfg = yaml.safe_load(open(args.config)) if os.path.exists(args.config) \
@@ -15,15 +34,69 @@ def main():
     sec = int(cfg.get("duration_sec", 30))
     m = int(cfg.get("hnsw_m", 32))
     ef = int(cfg.get("hnsw_ef_construction", 200))
+    attempts = int(cfg.get("max_attempts", 3))
+    dupe_sim = float(cfg.get("dupe_similarity", 0.995))
+    dupe_tol = float(cfg.get("dupe_duration_tol", 2.0))
+
+    def cluster_dupes():
+        from recutils.dupes import find_duplicates
+        print("== Clustering duplicates ==")
+        d = find_duplicates(min_similarity=dupe_sim, duration_tol=dupe_tol)
+        print(f"{d['tracks']} tracks in {d['groups']} duplicate groups "
+              f"({d['confirmed']} of {d['candidates']} candidate pairs confirmed).")
+
+    if args.dupes:
+        cluster_dupes()
+        return
+
+    if args.watch:
+        from recutils.watch import LibraryWatcher
+        LibraryWatcher(music_dir, sr=sr, sec=sec, hnsw_m=m, ef_c=ef,
+                       debounce_sec=float(cfg.get("watch_debounce_sec", 5)),
+                       max_wait_sec=float(cfg.get("watch_max_wait_sec", 30)),
+                       poll_sec=float(cfg.get("watch_poll_sec", 10)),
+                       use_inotify=not args.poll,
+                       dupe_similarity=dupe_sim, dupe_duration_tol=dupe_tol).run()
+        return
+
+    if args.manifest or args.worker or args.merge or args.status:
+        from recutils import shards
+        if args.manifest:
+            print("== Ingesting catalog ==")
+            ingest(music_dir)
+            man = shards.write_manifest(sr=sr, sec=sec, shard_size=args.shard_size,
+                                        max_attempts=attempts, retry_failed=args.retry_failed)
+            print(f"{man['pending']} of {man['total']} tracks pending in {len(man['shards'])} shards.")
+        elif args.worker:
+            if args.processes > 1:
+                n = shards.run_local_workers(args.processes, lease_sec=args.lease_sec)
+            else:
+                n = shards.run_worker(worker=args.worker_id, lease_sec=args.lease_sec)
+            print(f"Completed {n} shards.")
+        elif args.merge:
+            stats = shards.merge_shards()
+            print(f"Merged {stats['shards']} shards: {stats['ok']} ok, "
+                  f"{stats['short']} too short, {stats['error']} failed.")
+            print("== Building FAISS index ==")
+            # the rate the shards were extracted at, even if config changed since --manifest
+            n = build_faiss_index(hnsw_m=m, ef_c=ef, sample_rate=shards.load_manifest()["sample_rate"])
+            cluster_dupes()
+            print(f"Done. Indexed {n} tracks.")
+        else:
+            print(shards.shard_status(lease_sec=args.lease_sec))
+        return
 
     print("== Ingesting catalog ==")
     ingest(music_dir)
     print("== Extracting features ==")
-    build_features(sr=sr, sec=sec)
+    stats = build_features(sr=sr, sec=sec, max_attempts=attempts, retry_failed=args.retry_failed)
+    print(f"{stats['todo']} of {stats['total']} tracks needed work: "
+          f"{stats['ok']} ok, {stats['short']} too short, {stats['error']} failed.")
     print("== Building FAISS index ==")
-    n = build_faiss_index(hnsw_m=m, ef_c=ef)
+    n = build_faiss_index(hnsw_m=m, ef_c=ef, sample_rate=sr)
+    cluster_dupes()
     print(f"Done. Indexed {n} tracks.")
 
 
-if __name__ == "main":
+if __name__ == "__main__":
     main()
@@ -0,0 +1,66 @@
+import argparse, json, os, random, threading, time, http.client
+import numpy as np
+
+
+def _worker(host, port, ids, args, lat, errors, stop_at):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    rnd = random.Random()
+    while time.perf_counter() < stop_at:
+        if args.mode == "batch":
+            route = "/batch"
+            body = {"queries": [{"id": rnd.choice(ids), "k": args.k} for _ in range(args.batch_size)]}
+        elif args.mode == "filtered":
+            route = "/similar/filtered"
+            body = {"id": rnd.choice(ids), "k": args.k, "camelot": "seed"}
+        else:
+            route = "/similar"
+            body = {"id": rnd.choice(ids), "k": args.k}
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", route, json.dumps(body), {"Content-Type": "application/json"})
+            resp = conn.getresponse(); resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+        except Exception as e:
+            errors.append(repr(e))
+            conn.close(); conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        lat.append(time.perf_counter() - t0)
+    conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Closed-loop load generator for serve.py.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--concurrency", type=int, default=8, help="keep <= serve.py --workers")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--mode", choices=["similar", "filtered", "batch"], default="similar")
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--k", type=int, default=25)
+    args = ap.parse_args()
+
+    ids = json.load(open(os.path.join("data", "index", "row_ids.json")))
+    lat, errors = [], []
+    stop_at = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=_worker, args=(args.host, args.port, ids, args, lat, errors, stop_at))
+               for _ in range(args.concurrency)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+
+    per_req = args.batch_size if args.mode == "batch" else 1
+    print(f"{len(lat)} requests ({len(lat) * per_req} queries) in {elapsed:.1f}s, {len(errors)} errors")
+    if lat:
+        ms = np.array(lat) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"client: {len(lat) / elapsed:.1f} req/s, {len(lat) * per_req / elapsed:.1f} queries/s, "
+              f"p50 {p50:.2f}ms p95 {p95:.2f}ms p99 {p99:.2f}ms")
+    conn = http.client.HTTPConnection(args.host, args.port, timeout=10)
+    conn.request("GET", "/stats")
+    print("server:", json.dumps(json.loads(conn.getresponse().read()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
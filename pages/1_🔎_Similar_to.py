@@ -1,7 +1,8 @@
 import os, json, numpy as np, pandas as pd
 import streamlit as st
-from recutils.indexer import query_index, query_index_filtered, id_to_track, load_feature_matrix, lookup_by_path
+from recutils.indexer import query_index, query_index_filtered, id_to_track, load_feature_matrix, lookup_by_path, index_sample_rate
 from recutils.model import has_model
+from recutils.dupes import load_duplicate_groups, collapse_duplicates
 
 st.title("🔎 Similar to…")
 
@@ -16,11 +17,31 @@ if not (os.path.exists(index_path) and os.path.exists(ids_path) and os.path.isdi
 ids = json.load(open(ids_path))
 feat_files = [os.path.join(feat_dir, f"{tid}.npy") for tid in ids]
 
+@st.cache_data(show_spinner="Analyzing clip…", max_entries=8)
+def analyze_upload(data: bytes, name: str, exact_loudness: bool, sr: int):
+    # Uploaded clips are analyzed from a temp file and never cataloged.
+    import tempfile
+    from recutils.features import analyze_clip
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]) as tmp:
+        tmp.write(data); tmp.flush()
+        return analyze_clip(tmp.name, sr_target=sr, exact_loudness=exact_loudness)
+
 # --- Pick seed track ---
-seed_mode = st.radio("Choose seed:", ["Pick by file path", "Pick by track ID"])
+seed_mode = st.radio("Choose seed:", ["Pick by file path", "Pick by track ID", "Upload a clip"])
 seed = None
-
-if seed_mode == "Pick by file path":
+clip = None
+
+if seed_mode == "Upload a clip":
+    upload = st.file_uploader("Audio clip (not in your library)",
+                              type=["mp3", "flac", "m4a", "wav", "ogg", "aiff", "aif"])
+    exact_loudness = st.checkbox("Exact loudness (slower)", value=False)
+    if upload is not None:
+        try:
+            clip = analyze_upload(upload.getvalue(), upload.name, exact_loudness, index_sample_rate())
+            st.caption(f"Clip: {clip[1]:.1f} BPM, key {clip[2]} ({clip[3]})")
+        except Exception as e:
+            st.error(f"Could not analyze that clip: {e}")
+elif seed_mode == "Pick by file path":
     seed_path = st.text_input("Full path to a known track on disk:")
     if seed_path:
         tid = lookup_by_path(seed_path)
@@ -42,35 +63,45 @@ camel_mode = st.selectbox("Camelot mode", ["compatible", "same"]) if camel_filte
 camel_seed = st.text_input("Seed Camelot key (e.g., 8A, 9B). Leave blank to use seed track's key.") if camel_filter else ""
 
 rerank = st.checkbox("Re-rank by my predicted stars (if model trained)", value=False)
+collapse = st.checkbox("Collapse duplicate copies (MP3/FLAC/re-rips)", value=True)
 
 # --- Main logic ---
-if seed:
-    seed_feat_path = os.path.join(feat_dir, f"{seed}.npy")
-    if not os.path.exists(seed_feat_path):
-        st.error("No features for that track. Re-run build to include it.")
-        st.stop()
-
-    v = np.load(seed_feat_path)
+if seed or clip is not None:
+    if clip is not None:
+        v = clip[0]
+    else:
+        seed_feat_path = os.path.join(feat_dir, f"{seed}.npy")
+        if not os.path.exists(seed_feat_path):
+            st.error("No features for that track. Re-run build to include it.")
+            st.stop()
+        v = np.load(seed_feat_path)
 
     # Camelot seed handling
     camel_seed_val = camel_seed.strip().upper() if camel_filter and camel_seed.strip() else None
     if camel_filter and camel_seed_val is None:
-        row = id_to_track(seed)
-        # row = (id, path, title, artist, album, genre, duration, stars, bpm, key, camelot)
-        camel_seed_val = row[10] if row and len(row) > 10 else None
+        if clip is not None:
+            camel_seed_val = clip[3]
+        else:
+            row = id_to_track(seed)
+            # row = (id, path, title, artist, album, genre, duration, stars, bpm, key, camelot)
+            camel_seed_val = row[10] if row and len(row) > 10 else None
 
-    # Neighbor query
+    # Neighbor query (over-fetch when duplicates will be collapsed)
+    groups = load_duplicate_groups() if collapse else {}
+    k_fetch = k * 2 if groups else k
     if camel_filter or bpm_filter:
         neighbors = query_index_filtered(
             v,
-            k=k,
+            k=k_fetch,
             bpm_center=bpm_center if bpm_filter else None,
             bpm_tolerance=bpm_tol if bpm_filter else 6.0,
             camelot=camel_seed_val if camel_filter else None,
             camelot_mode=camel_mode if camel_filter else "compatible",
         )
     else:
-        neighbors = query_index(v, k=k)
+        neighbors = query_index(v, k=k_fetch)
+    if groups:
+        neighbors = collapse_duplicates(neighbors, groups, seed=seed or None, k=k)
 
     # Build dataframe
     rows = []
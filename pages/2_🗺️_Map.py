@@ -5,6 +5,7 @@ from recutils.indexer import load_feature_matrix, ids_to_meta
 st.title("🗺️ Map (UMAP)")
 
 umap_path = os.path.join("data","umap","umap_2d.npy")
+umap_ids_path = os.path.join("data","umap","umap_ids.json")
 ids_path  = os.path.join("data","index","row_ids.json")
 feat_dir  = os.path.join("data","features")
 badrows_path = os.path.join("data","umap","umap_dropped_rows.csv")
@@ -61,15 +62,9 @@ def standardize_features(X):
 
 if recompute or not os.path.exists(umap_path):
     st.write("Loading features…")
-    # Adjust this call if your load_feature_matrix returns (X, ids_from_features)
-    X, ids2 = load_feature_matrix()  # expected shape: (n_items, n_features)
-
-    if X.shape[0] != len(ids):
-        st.warning(f"Row count mismatch: features={X.shape[0]}, ids={len(ids)}. Will align by index; check your index build.")
-        # Align to min length
-        n = min(X.shape[0], len(ids))
-        X = X[:n]
-        ids = ids[:n]
+    # Label rows with the matrix's own ids: row_ids.json follows index order,
+    # which diverges from feature-file order once tracks are appended.
+    X, ids = load_feature_matrix()  # expected shape: (n_items, n_features)
 
     st.write("Cleaning features (handling NaN/inf, imputing)…")
     X_clean, good_mask = clean_features(X)
@@ -101,11 +96,17 @@ if recompute or not os.path.exists(umap_path):
 
     XY = reducer.fit_transform(X_clean).astype("float32")
     np.save(umap_path, XY)
+    json.dump(ids, open(umap_ids_path, "w"))
     st.success(f"Saved UMAP to {umap_path} with {XY.shape[0]} points.")
 
 else:
     st.info("Loading precomputed UMAP…")
     XY = np.load(umap_path)
+    if os.path.exists(umap_ids_path):
+        ids = json.load(open(umap_ids_path))
+    if len(ids) != XY.shape[0]:
+        st.warning("Saved map does not match the current ids; recompute it to refresh the labels.")
+        ids = (ids + [None] * XY.shape[0])[:XY.shape[0]]
 
 # --- Simple preview scatter (optional) ---
 try:
@@ -0,0 +1,46 @@
+import argparse, json, os, time, yaml
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Find library matches for an audio clip that is not in the catalog.")
+    ap.add_argument("clip")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--k", type=int, default=None)
+    ap.add_argument("--sec", type=float, default=15, help="seconds of the clip to analyze")
+    ap.add_argument("--exact-loudness", action="store_true",
+                    help="run the full BS.1770 loudness pass instead of the RMS estimate")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open(args.config)) if os.path.exists(args.config) \
+        else yaml.safe_load(open("config.example.yaml"))
+    k = args.k or int(cfg.get("neighbors_k", 25))
+    sr = int(cfg.get("sample_rate", 22050))
+
+    t0 = time.perf_counter()
+    from recutils.features import analyze_clip
+    from recutils.indexer import query_index, load_index, ids_to_meta, index_sample_rate
+    load_index()
+    sr = index_sample_rate(default=sr)
+    t1 = time.perf_counter()
+    feat, bpm, key, camel = analyze_clip(args.clip, sr_target=sr, sec=args.sec,
+                                         exact_loudness=args.exact_loudness)
+    t2 = time.perf_counter()
+    neighbors = query_index(feat, k=k)
+    t3 = time.perf_counter()
+    meta = ids_to_meta([tid for tid, _ in neighbors])
+
+    results = [dict(meta.get(tid, {"id": tid}), similarity=round(sim, 4)) for tid, sim in neighbors]
+    timing = dict(load_ms=round((t1 - t0) * 1000, 1), extract_ms=round((t2 - t1) * 1000, 1),
+                  search_ms=round((t3 - t2) * 1000, 2))
+    if args.json:
+        print(json.dumps(dict(clip=dict(bpm=bpm, key=key, camelot=camel), timing=timing, results=results)))
+        return
+    print(f"Clip: {bpm:.1f} BPM, {key} ({camel})  |  extract {timing['extract_ms']}ms, "
+          f"search {timing['search_ms']}ms (index load {timing['load_ms']}ms)")
+    for r in results:
+        print(f"{r['similarity']:.4f}  {r.get('artist')} – {r.get('title')}  [{r.get('bpm') or 0:.0f} BPM {r.get('camelot')}]  {r.get('path')}")
+
+
+if __name__ == "__main__":
+    main()
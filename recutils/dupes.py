@@ -0,0 +1,215 @@
+import os, re, sqlite3, numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from .indexer import DB_PATH, ensure_db, load_feature_matrix, load_all_meta, normalize_rows
+
+# Preferred copy of a duplicate group: lossless first, then the usual lossy formats.
+FORMAT_RANK = {".flac": 0, ".wav": 0, ".aiff": 0, ".aif": 0, ".m4a": 1, ".ogg": 1,
+               ".mp3": 2, ".aac": 2, ".wma": 3}
+
+
+# Bracketed title suffixes that describe the release, not the recording.
+# Mix/remix/edit qualifiers are kept so different versions never match.
+_RELEASE_NOISE = re.compile(r"[(\[][^)\]]*\b(remaster(ed)?|explicit|clean|bonus track|album version)\b[^)\]]*[)\]]")
+
+
+def _norm_tag(t: Optional[str]) -> Optional[str]:
+    if not t or t == "None":
+        return None
+    return re.sub(r"[^0-9a-z]+", "", t.lower()) or None
+
+
+def _norm_title(t: Optional[str]) -> Optional[str]:
+    if not t or t == "None":
+        return None
+    return _norm_tag(_RELEASE_NOISE.sub("", t.lower()))
+
+
+def _confirm(a: Dict, b: Dict, duration_tol: float) -> bool:
+    """Both durations known and within tolerance; title and artist equal wherever both are tagged.
+
+    Vector similarity alone never confirms a pair:
+
+    >>> _confirm({}, {}, 2.0)
+    False
+    >>> _confirm({"duration": 200.0}, {"duration": 201.5, "title": "Intro"}, 2.0)
+    True
+    """
+    da, db = a.get("duration"), b.get("duration")
+    if da is None or db is None or abs(float(da) - float(db)) > duration_tol:
+        return False
+    ta, tb = _norm_title(a.get("title")), _norm_title(b.get("title"))
+    if ta is not None and tb is not None and ta != tb:
+        return False
+    aa, ab = _norm_tag(a.get("artist")), _norm_tag(b.get("artist"))
+    return aa is None or ab is None or aa == ab
+
+
+def _canonical_key(m: Dict):
+    ext = os.path.splitext(m.get("path") or "")[1].lower()
+    return (FORMAT_RANK.get(ext, 4), -(m.get("stars") or 0), m.get("path") or "")
+
+
+def candidate_pairs(X: np.ndarray, min_similarity: float=0.995, batch: int=1024) -> List[Tuple[int, int, float]]:
+    """All row pairs (i < j) within the similarity radius, via batched range search.
+
+    Similarity follows ``query_index``: ``1 - squared L2`` on normalized rows.
+    """
+    import faiss
+    X = np.ascontiguousarray(normalize_rows(X))
+    index = faiss.IndexFlatL2(X.shape[1])
+    index.add(X)
+    radius = float(1.0 - min_similarity)
+    pairs = []
+    for start in range(0, len(X), batch):
+        lims, D, I = index.range_search(X[start:start + batch], radius)
+        for q in range(len(lims) - 1):
+            i = start + q
+            for d, j in zip(D[lims[q]:lims[q + 1]], I[lims[q]:lims[q + 1]]):
+                if j > i:
+                    pairs.append((i, int(j), float(1 - d)))
+    return pairs
+
+
+def _group(adj: Dict[str, set], meta: Dict) -> Dict[str, List[str]]:
+    """Canonical-first grouping: each canonical takes its unassigned confirmed neighbors."""
+    groups, assigned = {}, set()
+    for canon in sorted(adj, key=lambda t: _canonical_key(meta.get(t, {}))):
+        if canon in assigned:
+            continue
+        members = [t for t in adj[canon] if t not in assigned]
+        if not members:
+            continue
+        groups[canon] = [canon] + members
+        assigned.update(groups[canon])
+    return groups
+
+
+def _store_groups(c, groups: Dict[str, List[str]]):
+    for canon, members in groups.items():
+        c.executemany("INSERT INTO duplicates(id, group_id, canonical) VALUES(?,?,?)",
+                      [(t, canon, int(t == canon)) for t in members])
+
+
+def find_duplicates(min_similarity: float=0.995, duration_tol: float=2.0, batch: int=1024) -> Dict[str, int]:
+    """Cluster near-identical tracks and store the groups in ``duplicates``.
+
+    Candidates from the range search are confirmed by duration (required on
+    both copies) and, when both are tagged, by title and artist. Tracks are visited best format
+    (then highest rated) first; each unassigned track becomes a canonical
+    member, and only tracks confirmed directly against it join its group, so
+    A~B and B~C never merge A and C through B. The canonical id is the group id.
+    """
+    X, ids = load_feature_matrix()
+    meta = load_all_meta()
+    pairs = candidate_pairs(X, min_similarity=min_similarity, batch=batch)
+
+    adj = {}
+    confirmed = 0
+    for i, j, _sim in pairs:
+        a, b = ids[i], ids[j]
+        if not _confirm(meta.get(a, {}), meta.get(b, {}), duration_tol):
+            continue
+        confirmed += 1
+        adj.setdefault(a, set()).add(b)
+        adj.setdefault(b, set()).add(a)
+    groups = _group(adj, meta)
+
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
+    c.execute("DELETE FROM duplicates")
+    _store_groups(c, groups)
+    conn.commit(); conn.close()
+    return dict(candidates=len(pairs), confirmed=confirmed, groups=len(groups),
+                tracks=sum(len(m) for m in groups.values()))
+
+
+def update_duplicates(changed: Iterable[str], removed: Iterable[str]=(), min_similarity: float=0.995,
+                      duration_tol: float=2.0, batch: int=1024) -> Dict[str, int]:
+    """Re-cluster only the part of the library reachable from changed tracks.
+
+    Starting from the changed ids and every stored group that contains a
+    changed or removed track, confirmed neighbors are followed (pulling in
+    their stored groups) until the set stops growing. Grouping never crosses
+    that boundary, so regrouping it gives the same result as ``find_duplicates``
+    while the rest of the table is left alone.
+    """
+    import faiss
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
+    stored = dict(c.execute("SELECT id, group_id FROM duplicates").fetchall())
+    members = {}
+    for tid, g in stored.items():
+        members.setdefault(g, set()).add(tid)
+    removed = set(removed)
+    touched = set(changed) | removed
+    frontier = set(changed)
+    for g, ms in members.items():
+        if g in touched or ms & touched:
+            frontier |= ms
+    frontier -= removed
+    region = frontier | removed
+
+    X, ids = load_feature_matrix()
+    row = {tid: i for i, tid in enumerate(ids)}
+    X = np.ascontiguousarray(normalize_rows(X))
+    index = faiss.IndexFlatL2(X.shape[1])
+    index.add(X)
+    radius = float(1.0 - min_similarity)
+    meta = load_all_meta()
+
+    adj, seen, candidates = {}, set(), 0
+    frontier = {t for t in frontier if t in row}
+    while frontier:
+        seen |= frontier
+        todo, frontier = sorted(frontier), set()
+        for start in range(0, len(todo), batch):
+            chunk = todo[start:start + batch]
+            lims, D, I = index.range_search(X[[row[t] for t in chunk]], radius)
+            for q, a in enumerate(chunk):
+                for j in I[lims[q]:lims[q + 1]]:
+                    b = ids[j]
+                    if b == a:
+                        continue
+                    candidates += 1
+                    if not _confirm(meta.get(a, {}), meta.get(b, {}), duration_tol):
+                        continue
+                    adj.setdefault(a, set()).add(b)
+                    adj.setdefault(b, set()).add(a)
+                    new = {b} | members.get(stored.get(b), set())
+                    frontier |= {t for t in new if t in row and t not in seen}
+    groups = _group(adj, meta)
+
+    region |= seen
+    c.executemany("DELETE FROM duplicates WHERE id=?", [(t,) for t in region])
+    _store_groups(c, groups)
+    conn.commit(); conn.close()
+    return dict(searched=len(seen), candidates=candidates, groups=len(groups),
+                tracks=sum(len(m) for m in groups.values()))
+
+
+def load_duplicate_groups() -> Dict[str, str]:
+    """Map track id -> group id for every track that has duplicates."""
+    if not os.path.exists(DB_PATH):
+        return {}
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute("SELECT id, group_id FROM duplicates").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return dict(rows)
+
+
+def collapse_duplicates(neighbors, groups: Dict[str, str], seed: Optional[str]=None, k: Optional[int]=None):
+    """Keep the best-ranked copy per duplicate group and drop the seed's copies."""
+    seen = set()
+    if seed is not None:
+        seen.add(groups.get(seed, seed))
+    out = []
+    for tid, sim in neighbors:
+        g = groups.get(tid, tid)
+        if g in seen and tid != seed:
+            continue
+        seen.add(g)
+        out.append((tid, sim))
+    return out[:k] if k is not None else out
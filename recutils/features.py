@@ -1,44 +1,86 @@
 import os, hashlib, numpy as np
 from typing import Optional, Dict, Any
-import librosa, pyloudnorm as pyln
-from mutagen import File as MFile
 from .theory import estimate_key_from_chroma
 
 AUDIO_EXTS = (".mp3",".flac",".m4a",".wav",".ogg",".aiff",".aif",".wma",".aac")
+FEATURE_VERSION = 1  # bump when analyze_track output changes
+MIN_SECONDS = 5
 
 def track_id(path: str) -> str:
     return hashlib.md5(path.encode("utf-8")).hexdigest()[:16]
 
+class AudioTooShort(ValueError):
+    pass
+
+
+def feature_fingerprint(sr_target: int = 22050, sec: int = 30) -> str:
+    """Identify the extractor version and parameters a feature vector was built with."""
+    key = f"v{FEATURE_VERSION}:sr={int(sr_target)}:sec={int(sec)}"
+    return hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _feature_vector(y: np.ndarray, sr: int, lufs: float):
+    import librosa
+    tempo = float(librosa.beat.tempo(y=y, sr=sr, aggregate=np.median))
+    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
+    spec_cent = librosa.feature.spectral_centroid(y=y, sr=sr)
+    spec_bw = librosa.feature.spectral_bandwidth(y=y, sr=sr)
+    roll = librosa.feature.spectral_rolloff(y=y, sr=sr)
+    zcr = librosa.feature.zero_crossing_rate(y)
+    key, _mode, camel = estimate_key_from_chroma(chroma)
+    feat = np.concatenate([
+    chroma.mean(1), chroma.std(1),
+    mfcc.mean(1), mfcc.std(1),
+    spec_cent.mean(1), spec_cent.std(1),
+    spec_bw.mean(1), spec_bw.std(1),
+    roll.mean(1), roll.std(1),
+    zcr.mean(1), zcr.std(1),
+    np.array([tempo, lufs])
+    ]).astype("float32")
+    return feat, tempo, key, camel
+
+
+def analyze_track(path: str, sr_target: int = 22050, sec: int = 30):
+    """Decode once and return (feat, bpm, key, camelot). Raises on failure."""
+    import librosa, pyloudnorm as pyln
+    y, sr = librosa.load(path, sr=sr_target, mono=True, duration=sec)
+    if len(y) < sr * MIN_SECONDS:
+        raise AudioTooShort(f"{len(y) / sr:.1f}s of audio, need {MIN_SECONDS}s")
+    meter = pyln.Meter(sr)
+    lufs = float(meter.integrated_loudness(y))
+    return _feature_vector(y, sr, lufs)
+
+
+def analyze_clip(path: str, sr_target: int = 22050, sec: float = 15, exact_loudness: bool = False):
+    """Latency-oriented variant of ``analyze_track`` for ad-hoc query clips.
+
+    Same vector layout, but decodes a shorter window with a faster resampler
+    and, unless ``exact_loudness``, replaces the gated BS.1770 pass with an
+    ungated RMS estimate of LUFS. Returns (feat, bpm, key, camelot).
+    """
+    import librosa
+    y, sr = librosa.load(path, sr=sr_target, mono=True, duration=sec, res_type="soxr_lq")
+    if len(y) < sr * MIN_SECONDS:
+        raise AudioTooShort(f"{len(y) / sr:.1f}s of audio, need {MIN_SECONDS}s")
+    if exact_loudness:
+        import pyloudnorm as pyln
+        lufs = float(pyln.Meter(sr).integrated_loudness(y))
+    else:
+        lufs = float(-0.691 + 10 * np.log10(np.mean(np.square(y, dtype=np.float64)) + 1e-12))
+    return _feature_vector(y, sr, lufs)
+
+
 def extract_features(path: str, sr_target: int = 22050, sec: int = 30) -> Optional[np.ndarray]:
     try:
-        y, sr = librosa.load(path, sr=sr_target, mono=True, duration=sec)
-        if len(y) < sr * 5:
-            return None
-        meter = pyln.Meter(sr)
-        lufs = float(meter.integrated_loudness(y))
-        tempo = float(librosa.beat.tempo(y=y, sr=sr, aggregate=np.median))
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-        spec_cent = librosa.feature.spectral_centroid(y=y, sr=sr)
-        spec_bw = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-        roll = librosa.feature.spectral_rolloff(y=y, sr=sr)
-        zcr = librosa.feature.zero_crossing_rate(y)
-        _key, _mode, _camel = estimate_key_from_chroma(chroma)
-        feat = np.concatenate([
-        chroma.mean(1), chroma.std(1),
-        mfcc.mean(1), mfcc.std(1),
-        spec_cent.mean(1), spec_cent.std(1),
-        spec_bw.mean(1), spec_bw.std(1),
-        roll.mean(1), roll.std(1),
-        zcr.mean(1), zcr.std(1),
-        np.array([tempo, lufs])
-        ]).astype("float32")
+        feat, _bpm, _key, _camel = analyze_track(path, sr_target=sr_target, sec=sec)
         return feat
     except Exception:
         return None
 
 
 def read_tags(path: str) -> Dict[str, Any]:
+    from mutagen import File as MFile
     try:
         a = MFile(path)
         title = artist = album = genre = year = duration = None
@@ -62,9 +104,10 @@ def walk_music_dir(music_dir: str):
 
 
 def quick_bpm_key(path: str, sr_target: int = 22050, sec: int = 30):
+    import librosa
     try:
         y, sr = librosa.load(path, sr=sr_target, mono=True, duration=sec)
-        if len(y) < sr * 5:
+        if len(y) < sr * MIN_SECONDS:
             return None, None, None
         tempo = float(librosa.beat.tempo(y=y, sr=sr, aggregate=np.median))
         chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
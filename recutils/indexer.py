@@ -1,21 +1,19 @@
-import os, json, sqlite3, numpy as np
-from typing import List, Tuple
-from tqdm import tqdm
-import faiss
-from .features import track_id, extract_features, read_tags, walk_music_dir, quick_bpm_key
+import os, json, time, shutil, sqlite3, threading, numpy as np
+from typing import List, Optional, Tuple
+from .features import track_id, analyze_track, feature_fingerprint, read_tags, walk_music_dir, AudioTooShort
 
 DATA_DIR = "data"
 FEAT_DIR = os.path.join(DATA_DIR, "features")
 INDEX_DIR = os.path.join(DATA_DIR, "index")
 UMAP_DIR = os.path.join(DATA_DIR, "umap")
 DB_PATH = os.path.join(DATA_DIR, "tracks.sqlite")
-
-os.makedirs(FEAT_DIR, exist_ok=True)
-os.makedirs(INDEX_DIR, exist_ok=True)
-os.makedirs(UMAP_DIR, exist_ok=True)
+INDEX_PATH = os.path.join(INDEX_DIR, "faiss_hnsw.index")
+IDS_PATH = os.path.join(INDEX_DIR, "row_ids.json")
+GEN_PATH = os.path.join(INDEX_DIR, "generation.json")
 
 
 def ensure_db():
+    os.makedirs(DATA_DIR, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("""CREATE TABLE IF NOT EXISTS tracks(
@@ -23,7 +21,21 @@ def ensure_db():
     path TEXT UNIQUE,
     title TEXT, artist TEXT, album TEXT, year INT, genre TEXT,
     duration REAL, stars INT,
-    bpm REAL, key TEXT, camelot TEXT
+    bpm REAL, key TEXT, camelot TEXT,
+    mtime REAL, size INT
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS feature_jobs(
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    error TEXT,
+    attempts INT DEFAULT 0,
+    fingerprint TEXT,
+    updated_at REAL
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS duplicates(
+    id TEXT PRIMARY KEY,
+    group_id TEXT,
+    canonical INT
     )""")
     conn.commit(); conn.close()
     _migrate_add_columns()
@@ -37,10 +49,15 @@ def _migrate_add_columns():
     except Exception: pass
     try: c.execute("ALTER TABLE tracks ADD COLUMN camelot TEXT")
     except Exception: pass
+    try: c.execute("ALTER TABLE tracks ADD COLUMN mtime REAL")
+    except Exception: pass
+    try: c.execute("ALTER TABLE tracks ADD COLUMN size INT")
+    except Exception: pass
     conn.commit(); conn.close()
 
 
 def ingest(music_dir: str):
+    from tqdm import tqdm
     ensure_db()
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
@@ -49,29 +66,109 @@ def ingest(music_dir: str):
     for p in tqdm(paths, desc="Cataloging"):
         tid = track_id(p)
         tags = read_tags(p)
-        c.execute("""INSERT OR IGNORE INTO tracks(id,path,title,artist,album,year,genre,duration,stars,bpm,key,camelot)
-        VALUES(?,?,?,?,?,?,?,?,NULL,NULL,NULL,NULL)""",
+        st = os.stat(p)
+        c.execute("""INSERT OR IGNORE INTO tracks(id,path,title,artist,album,year,genre,duration,stars,bpm,key,camelot,mtime,size)
+        VALUES(?,?,?,?,?,?,?,?,NULL,NULL,NULL,NULL,?,?)""",
         (tid, p, tags["title"], tags["artist"], tags["album"], tags["year"], \
-         tags["genre"], tags["duration"]))
+         tags["genre"], tags["duration"], st.st_mtime, st.st_size))
     conn.commit(); conn.close()
 
 
-def build_features(sr: int=22050, sec: int=30):
+def forget_tracks(ids: List[str]):
+    """Drop tracks (and their vectors) that disappeared from the library."""
+    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
+    for tid in ids:
+        for table in ("tracks", "feature_jobs", "duplicates"):
+            c.execute(f"DELETE FROM {table} WHERE id=?", (tid,))
+        out = os.path.join(FEAT_DIR, f"{tid}.npy")
+        if os.path.exists(out):
+            os.remove(out)
+    conn.commit(); conn.close()
+
+
+def _needs_extraction(job, has_feat: bool, fp: str, max_attempts: int) -> bool:
+    status, attempts, job_fp = job
+    if job_fp != fp:
+        return True
+    if status == "ok":
+        return not has_feat
+    if status == "short":
+        return False
+    return (attempts or 0) < max_attempts
+
+
+def plan_features(sr: int=22050, sec: int=30, max_attempts: int=3, retry_failed: bool=False):
+    """Return ``(todo, total)`` where todo is ``[(tid, path, prior_attempts)]``.
+
+    A track is (re)extracted when it has no job row, when its stored fingerprint
+    differs from the current extractor version/params, or when it failed fewer
+    than ``max_attempts`` times. Too-short files are recorded and not retried
+    until the fingerprint changes. ``retry_failed`` resets failed attempts.
+    Legacy ``.npy`` files without a job row are adopted as up to date.
+    """
+    ensure_db()
+    fp = feature_fingerprint(sr, sec)
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
+    if retry_failed:
+        c.execute("UPDATE feature_jobs SET attempts=0 WHERE status='error'")
     rows = c.execute("SELECT id, path FROM tracks").fetchall()
+    jobs = {r[0]: r[1:] for r in c.execute("SELECT id, status, attempts, fingerprint FROM feature_jobs")}
+
+    todo = []
+    now = time.time()
+    for tid, path in rows:
+        has_feat = os.path.exists(os.path.join(FEAT_DIR, f"{tid}.npy"))
+        job = jobs.get(tid)
+        if job is None and has_feat:
+            c.execute("INSERT INTO feature_jobs(id,status,error,attempts,fingerprint,updated_at) VALUES(?,?,?,?,?,?)",
+                      (tid, "ok", None, 1, fp, now))
+        elif job is None or _needs_extraction(job, has_feat, fp, max_attempts):
+            attempts = (job[1] or 0) if job is not None and job[2] == fp else 0
+            todo.append((tid, path, attempts))
+    conn.commit(); conn.close()
+    return todo, len(rows)
+
+
+def extract_track(path: str, out: str, sr: int=22050, sec: int=30):
+    """Analyze one file, saving its vector to ``out``; never raises."""
+    res = dict(status="ok", error=None, bpm=None, key=None, camelot=None)
+    try:
+        feat, res["bpm"], res["key"], res["camelot"] = analyze_track(path, sr_target=sr, sec=sec)
+        np.save(out, feat)
+    except AudioTooShort as e:
+        res.update(status="short", error=str(e))
+    except Exception as e:
+        res.update(status="error", error=f"{type(e).__name__}: {e}")
+    return res
+
+
+def record_feature_job(c, tid: str, res, attempts: int, fp: str):
+    """Store an extraction result in ``tracks`` and ``feature_jobs``."""
+    out = os.path.join(FEAT_DIR, f"{tid}.npy")
+    if res["status"] != "ok" and os.path.exists(out):
+        os.remove(out)  # stale vector from other params
+    c.execute("UPDATE tracks SET bpm=?, key=?, camelot=? WHERE id=?", (res["bpm"], res["key"], res["camelot"], tid))
+    c.execute("""INSERT OR REPLACE INTO feature_jobs(id,status,error,attempts,fingerprint,updated_at)
+    VALUES(?,?,?,?,?,?)""", (tid, res["status"], res["error"], attempts, fp, time.time()))
+
+
+def build_features(sr: int=22050, sec: int=30, max_attempts: int=3, retry_failed: bool=False):
+    """Extract features for the tracks ``plan_features`` says need it."""
+    from tqdm import tqdm
+    todo, total = plan_features(sr, sec, max_attempts, retry_failed)
+    os.makedirs(FEAT_DIR, exist_ok=True)
+    fp = feature_fingerprint(sr, sec)
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    stats = dict(total=total, todo=len(todo), ok=0, short=0, error=0)
+    for tid, path, attempts in tqdm(todo, desc="Extracting features"):
+        res = extract_track(path, os.path.join(FEAT_DIR, f"{tid}.npy"), sr=sr, sec=sec)
+        stats[res["status"]] += 1
+        record_feature_job(c, tid, res, attempts + 1, fp)
+        conn.commit()
     conn.close()
-    for tid, path in tqdm(rows, desc="Extracting features"):
-        out = os.path.join(FEAT_DIR, f"{tid}.npy")
-        if os.path.exists(out):
-            continue
-        feat = extract_features(path, sr_target=sr, sec=sec)
-        if feat is not None:
-            np.save(out, feat)
-        bpm, key, camel = quick_bpm_key(path, sr_target=sr, sec=sec)
-        conn2 = sqlite3.connect(DB_PATH); c2 = conn2.cursor()
-        c2.execute("UPDATE tracks SET bpm=?, key=?, camelot=? WHERE id=?", (bpm, key, camel, tid))
-        conn2.commit(); conn2.close()
+    return stats
 
 
 def load_feature_matrix() -> Tuple[np.ndarray, List[str]]:
@@ -81,25 +178,148 @@ def load_feature_matrix() -> Tuple[np.ndarray, List[str]]:
     return X.astype("float32"), ids
 
 
-def build_faiss_index(hnsw_m: int=32, ef_c: int=200):
+def normalize_rows(X: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors exactly as the index was built (cosine via L2)."""
+    X = np.asarray(X, dtype="float32")
+    return (X / (np.linalg.norm(X, axis=-1, keepdims=True) + 1e-9)).astype("float32")
+
+
+def _read_generation():
+    try:
+        return json.load(open(GEN_PATH))
+    except (OSError, ValueError):
+        return {}
+
+
+def index_sample_rate(default: int=22050) -> int:
+    """Sample rate the indexed vectors were extracted at, as recorded at build time."""
+    return int(_read_generation().get("sample_rate") or default)
+
+
+def _gen_paths(gen: int) -> Tuple[str, str]:
+    return (os.path.join(INDEX_DIR, f"faiss_hnsw.{gen}.index"),
+            os.path.join(INDEX_DIR, f"row_ids.{gen}.json"))
+
+
+def _current_paths() -> Tuple[str, str]:
+    """Index and ids files of the published generation (legacy names for old builds)."""
+    g = _read_generation()
+    if g.get("index") and g.get("ids"):
+        return os.path.join(INDEX_DIR, g["index"]), os.path.join(INDEX_DIR, g["ids"])
+    return INDEX_PATH, IDS_PATH
+
+
+def _link_over(src: str, dst: str):
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _publish_index(index, ids: List[str], sample_rate: Optional[int]=None):
+    """Publish index and row ids as a new generation.
+
+    Both files are written under generation-stamped names and only then does
+    ``generation.json`` switch to them, so a reader always gets a matching
+    pair. The unstamped names are refreshed afterwards for the pages' checks
+    and older readers; stamped files older than the previous generation go.
+    """
+    import faiss
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    prev = _read_generation()
+    gen = int(prev.get("generation", 0)) + 1
+    index_path, ids_path = _gen_paths(gen)
+    faiss.write_index(index, index_path)
+    json.dump(ids, open(ids_path, "w"))
+    sample_rate = sample_rate or prev.get("sample_rate")
+    json.dump(dict(generation=gen, index=os.path.basename(index_path), ids=os.path.basename(ids_path),
+                   count=len(ids), sample_rate=sample_rate, updated_at=time.time()),
+              open(GEN_PATH + ".tmp", "w"))
+    os.replace(GEN_PATH + ".tmp", GEN_PATH)
+    _link_over(ids_path, IDS_PATH)
+    _link_over(index_path, INDEX_PATH)
+    for old in range(1, gen - 1):
+        for p in _gen_paths(old):
+            if os.path.exists(p):
+                os.remove(p)
+    return gen
+
+
+def build_faiss_index(hnsw_m: int=32, ef_c: int=200, sample_rate: Optional[int]=None):
+    import faiss
     X, ids = load_feature_matrix()
-    X = X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-9)
+    X = normalize_rows(X)
     d = X.shape[1]
     index = faiss.IndexHNSWFlat(d, hnsw_m)
     index.hnsw.efConstruction = ef_c
     index.add(X)
-    os.makedirs(INDEX_DIR, exist_ok=True)
-    faiss.write_index(index, os.path.join(INDEX_DIR, "faiss_hnsw.index"))
-    json.dump(ids, open(os.path.join(INDEX_DIR, "row_ids.json"), "w"))
+    _publish_index(index, ids, sample_rate=sample_rate)
     return len(ids)
 
 
+def clear_index() -> int:
+    """Publish an empty generation once no vectors are left; returns rows indexed (0)."""
+    import faiss
+    index_path, _ids_path = _current_paths()
+    if os.path.exists(index_path):
+        old = faiss.read_index(index_path)
+        _publish_index(faiss.IndexHNSWFlat(old.d, 32), [])
+    return 0
+
+
+def add_to_index(new_ids: List[str]) -> int:
+    """Append vectors for new tracks to the existing index; returns rows added."""
+    import faiss
+    index_path, ids_path = _current_paths()
+    index = faiss.read_index(index_path)
+    ids = json.load(open(ids_path))
+    known = set(ids)
+    add = [t for t in dict.fromkeys(new_ids)
+           if t not in known and os.path.exists(os.path.join(FEAT_DIR, f"{t}.npy"))]
+    if not add:
+        return 0
+    X = normalize_rows(np.stack([np.load(os.path.join(FEAT_DIR, f"{t}.npy")) for t in add]))
+    index.add(X)
+    _publish_index(index, ids + add)
+    return len(add)
+
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def index_generation():
+    """Cheap change token for the published index (stat only)."""
+    for p in (GEN_PATH, INDEX_PATH):
+        try:
+            st = os.stat(p)
+            return (p, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def load_index():
+    """Return ``(index, ids)``, reloading only when a new generation is published."""
+    import faiss
+    key = index_generation()
+    with _index_lock:
+        if _index_cache.get("key") != key or "index" not in _index_cache:
+            index_path, ids_path = _current_paths()
+            index = faiss.read_index(index_path)
+            ids = json.load(open(ids_path))
+            _index_cache.update(key=key, index=index, ids=ids)
+        return _index_cache["index"], _index_cache["ids"]
+
+
 def query_index(vec, k=25):
-    index = faiss.read_index(os.path.join(INDEX_DIR, "faiss_hnsw.index"))
-    ids = json.load(open(os.path.join(INDEX_DIR, "row_ids.json")))
-    v = vec / (np.linalg.norm(vec)+1e-9)
-    D, I = index.search(v[None,:].astype("float32"), k)
-    return [(ids[i], float(1 - D[0, j])) for j, i in enumerate(I[0])]
+    index, ids = load_index()
+    D, I = index.search(normalize_rows(vec)[None, :], k)
+    return [(ids[i], float(1 - D[0, j])) for j, i in enumerate(I[0]) if i >= 0]
 
 
 def id_to_track(tid: str):
@@ -130,25 +350,41 @@ def ids_to_meta(ids: List[str]):
     return x
 
 
-def query_index_filtered(vec, k=50, bpm_center=None, bpm_tolerance=6.0,
-                         camelot=None, camelot_mode="compatible"):
-    base = query_index(vec, k=k*3)
-    ids = [tid for tid, sim in base]
-    meta = ids_to_meta(ids)
+def load_all_meta():
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT id, path, title, artist, album, genre, duration, stars, bpm, key, camelot FROM tracks").fetchall()
+    conn.close()
+    return {
+        r[0]: dict(id=r[0], path=r[1], title=r[2], artist=r[3], album=r[4], genre=r[5], \
+                   duration=r[6], stars=r[7], bpm=r[8], key=r[9], camelot=r[10]) for r in rows
+        }
+
+
+def filter_neighbors(base, meta, k=50, bpm_center=None, bpm_tolerance=6.0,
+                     camelot=None, camelot_mode="compatible"):
+    from .theory import camelot_neighbors
+    allowed = None
+    if camelot is not None:
+        allowed = {camelot} if camelot_mode == "same" else camelot_neighbors(camelot)
 
     def camel_ok(cand):
-        if camelot is None: return True
-        c = meta[cand].get("camelot")
-        if not c: return False
-        if camelot_mode == "same": return c == camelot
-        from .theory import camelot_neighbors
-        return c in camelot_neighbors(camelot)
+        if allowed is None: return True
+        c = meta.get(cand, {}).get("camelot")
+        return bool(c) and c in allowed
 
     def bpm_ok(cand):
         if bpm_center is None: return True
-        b = meta[cand].get("bpm")
+        b = meta.get(cand, {}).get("bpm")
         if b is None: return False
         return abs(float(b) - float(bpm_center)) <= float(bpm_tolerance)
 
     filtered = [(tid, sim) for tid, sim in base if camel_ok(tid) and bpm_ok(tid)]
     return filtered[:k]
+
+
+def query_index_filtered(vec, k=50, bpm_center=None, bpm_tolerance=6.0,
+                         camelot=None, camelot_mode="compatible"):
+    base = query_index(vec, k=k*3)
+    meta = ids_to_meta([tid for tid, sim in base])
+    return filter_neighbors(base, meta, k=k, bpm_center=bpm_center, bpm_tolerance=bpm_tolerance,
+                            camelot=camelot, camelot_mode=camelot_mode)
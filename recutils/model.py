@@ -1,10 +1,8 @@
-import os, sqlite3, joblib, numpy as np
+import os, sqlite3, numpy as np
 from typing import List
 from .indexer import DB_PATH, load_feature_matrix
-import lightgbm as lgb
 
 MODEL_DIR = "data/model"
-os.makedirs(MODEL_DIR, exist_ok=True)
 MODEL_PATH = os.path.join(MODEL_DIR, "lgbm_stars.pkl")
 
 
@@ -18,6 +16,7 @@ def _load_labels(ids: List[str]) -> np.ndarray:
 
 
 def train_model() -> int:
+    import joblib, lightgbm as lgb
     X, ids = load_feature_matrix()
     y = _load_labels(ids)
     mask = ~np.isnan(y)
@@ -28,6 +27,7 @@ def train_model() -> int:
     params = dict(objective="regression", n_estimators=600, learning_rate=0.05, num_leaves=63)
     model = lgb.LGBMRegressor(**params)
     model.fit(Xtr, ytr)
+    os.makedirs(MODEL_DIR, exist_ok=True)
     joblib.dump({"model": model, "ids": ids}, MODEL_PATH)
     return int(mask.sum())
 
@@ -38,6 +38,7 @@ def has_model() -> bool:
 def predict_scores(vecs: np.ndarray) -> np.ndarray:
     if not has_model():
         raise RuntimeError("Model not trained")
+    import joblib
     blob = joblib.load(MODEL_PATH)
     model = blob["model"]
     return model.predict(vecs)
@@ -0,0 +1,336 @@
+import os, re, json, time, queue, threading, numpy as np
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from .indexer import filter_neighbors, load_all_meta, load_index, normalize_rows, index_sample_rate
+from .dupes import load_duplicate_groups, collapse_duplicates
+
+
+_CAMELOT = re.compile(r"^(seed|(1[0-2]|[1-9])[AaBb])$")
+
+
+class ServiceStats:
+    """Thread-safe request counters and a rolling latency window."""
+
+    def __init__(self, window: int = 2048, qps_window_sec: float = 10.0):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.stamps = deque()
+        self.qps_window_sec = qps_window_sec
+        self.batches = 0
+        self.batched_rows = 0
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        now = time.time()
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if not ok:
+                self.errors += 1
+            self.latencies.append(seconds)
+            self.stamps.append(now)
+            while self.stamps and self.stamps[0] < now - self.qps_window_sec:
+                self.stamps.popleft()
+
+    def record_batch(self, rows: int):
+        with self.lock:
+            self.batches += 1
+            self.batched_rows += rows
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        with self.lock:
+            lat = np.array(self.latencies, dtype=float) * 1000.0
+            total = sum(self.requests.values())
+            recent = sum(1 for t in self.stamps if t >= now - self.qps_window_sec)
+            uptime = now - self.started
+            snap = dict(
+                uptime_sec=round(uptime, 1),
+                requests=dict(self.requests),
+                total=total,
+                errors=self.errors,
+                qps_overall=round(total / uptime, 2) if uptime > 0 else 0.0,
+                qps_recent=round(recent / self.qps_window_sec, 2),
+                searches=self.batches,
+                mean_batch_rows=round(self.batched_rows / self.batches, 2) if self.batches else 0.0,
+            )
+        if len(lat):
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+            snap["latency_ms"] = dict(p50=round(p50, 2), p95=round(p95, 2), p99=round(p99, 2),
+                                      max=round(float(lat.max()), 2))
+        return snap
+
+
+class SearchBatcher:
+    """Coalesce concurrent searches into one ``index.search`` call.
+
+    Callers block on a future while a single worker thread drains the queue,
+    waiting up to ``wait_ms`` for more requests until ``max_batch`` rows are
+    collected. FAISS parallelises the batched search internally.
+    """
+
+    def __init__(self, index, max_batch: int = 64, wait_ms: float = 2.0, stats: Optional[ServiceStats] = None):
+        self.index = index
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self.stats = stats
+        self.q = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="vdj-batcher", daemon=True)
+        self.thread.start()
+
+    def search(self, vecs: np.ndarray, k: int):
+        fut = Future()
+        self.q.put((np.asarray(vecs, dtype="float32"), int(k), fut))
+        return fut.result()
+
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
+
+    def _collect(self, first):
+        batch, rows = [first], len(first[0])
+        deadline = time.perf_counter() + self.wait
+        while rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.q.get(timeout=remaining) if remaining > 0 else self.q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.q.put(None)
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.q.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            try:
+                X = np.vstack([vecs for vecs, _, _ in batch])
+                D, I = self.index.search(X, max(k for _, k, _ in batch))
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            if self.stats is not None:
+                self.stats.record_batch(len(X))
+            row = 0
+            for vecs, k, fut in batch:
+                n = len(vecs)
+                fut.set_result((D[row:row+n, :k], I[row:row+n, :k]))
+                row += n
+
+
+class QueryService:
+    """Index, row ids, vectors and track metadata loaded once and kept warm."""
+
+    def __init__(self, max_batch: int = 64, wait_ms: float = 2.0, default_k: int = 25,
+                 sample_rate: int = 22050):
+        self.index, self.ids = load_index()
+        # clips must be analyzed at the rate the library vectors were built with
+        self.sample_rate = index_sample_rate(default=sample_rate)
+        self.row = {tid: i for i, tid in enumerate(self.ids)}
+        # rows are already normalized, as written by build_faiss_index
+        self.X = self.index.reconstruct_n(0, self.index.ntotal)
+        self.meta = load_all_meta()
+        self.by_path = {m["path"]: tid for tid, m in self.meta.items()}
+        self.groups = load_duplicate_groups()
+        self.default_k = default_k
+        self.stats = ServiceStats()
+        self.batcher = SearchBatcher(self.index, max_batch=max_batch, wait_ms=wait_ms, stats=self.stats)
+
+    def close(self):
+        self.batcher.close()
+
+    def _seed(self, q: Dict):
+        if q.get("clip"):
+            from .features import analyze_clip
+            if not os.path.isfile(q["clip"]):
+                raise KeyError(f"clip not found: {q['clip']}")
+            feat = analyze_clip(q["clip"], sr_target=self.sample_rate,
+                                exact_loudness=bool(q.get("exact_loudness")))[0]
+            return None, normalize_rows(feat)
+        if q.get("vector") is not None:
+            v = np.asarray(q["vector"], dtype="float32")
+            if v.shape != (self.index.d,):
+                raise ValueError(f"vector must have {self.index.d} dims")
+            return None, normalize_rows(v)
+        tid = q.get("id")
+        if tid is None and q.get("path"):
+            tid = self.by_path.get(q["path"])
+            if tid is None:
+                raise KeyError(f"path not in catalog: {q['path']}")
+        if tid is None:
+            raise ValueError("query needs one of: id, path, vector, clip")
+        if tid not in self.row:
+            raise KeyError(f"track not indexed: {tid}")
+        return tid, self.X[self.row[tid]]
+
+    def _fetch_k(self, q: Dict) -> int:
+        k = int(q.get("k", self.default_k))
+        if not 1 <= k <= 1000:
+            raise ValueError("k must be in 1..1000")
+        if q.get("filtered"):
+            # validated up front so a bad filter fails only its own query in a batch
+            camelot = q.get("camelot")
+            if camelot is not None and not (isinstance(camelot, str) and _CAMELOT.match(camelot)):
+                raise ValueError("camelot must be a string such as \"8A\" or \"seed\"")
+            if q.get("camelot_mode", "compatible") not in ("compatible", "same"):
+                raise ValueError("camelot_mode must be \"compatible\" or \"same\"")
+            k *= 3
+        return k * 2 if self.groups and q.get("collapse", True) else k
+
+    def _finish(self, q: Dict, seed: Optional[str], D: np.ndarray, I: np.ndarray) -> Dict:
+        k = int(q.get("k", self.default_k))
+        base = [(self.ids[i], float(1 - d)) for d, i in zip(D, I) if i >= 0]
+        if q.get("filtered"):
+            camelot = q.get("camelot")
+            if camelot == "seed":
+                camelot = self.meta.get(seed, {}).get("camelot") if seed else None
+            base = filter_neighbors(
+                base, self.meta, k=len(base),
+                bpm_center=q.get("bpm_center"),
+                bpm_tolerance=q.get("bpm_tolerance", 6.0),
+                camelot=camelot.upper() if camelot else None,
+                camelot_mode=q.get("camelot_mode", "compatible"),
+            )
+        if self.groups and q.get("collapse", True):
+            base = collapse_duplicates(base, self.groups, seed=seed)
+        results = [dict(self.meta.get(tid, {"id": tid}), similarity=round(sim, 4)) for tid, sim in base[:k]]
+        return {"seed": seed, "results": results}
+
+    def query(self, q: Dict) -> Dict:
+        seed, v = self._seed(q)
+        D, I = self.batcher.search(v[None, :], self._fetch_k(q))
+        return self._finish(q, seed, D[0], I[0])
+
+    def query_batch(self, queries: List[Dict]) -> List[Dict]:
+        out = [None] * len(queries)
+        seeds, vecs, ks, rows = [], [], [], []
+        for j, q in enumerate(queries):
+            if not isinstance(q, dict):
+                out[j] = {"error": "query must be a JSON object"}
+                continue
+            try:
+                seed, v = self._seed(q)
+                ks.append(self._fetch_k(q))
+            except (KeyError, ValueError) as e:
+                out[j] = {"error": str(e).strip("'\"")}
+                continue
+            except Exception as e:  # e.g. a clip the decoder cannot read
+                out[j] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            seeds.append(seed); vecs.append(v); rows.append(j)
+        if rows:
+            D, I = self.batcher.search(np.stack(vecs), max(ks))
+            for n, j in enumerate(rows):
+                out[j] = self._finish(queries[j], seeds[n], D[n, :ks[n]], I[n, :ks[n]])
+        return out
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands connections to a fixed thread pool."""
+
+    def __init__(self, addr, handler, service: QueryService, workers: int = 16):
+        super().__init__(addr, handler)
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vdj-http")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # threads still reading an idle keep-alive socket exit at the handler timeout
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+POST_ROUTES = ("/similar", "/similar/filtered", "/batch")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 15  # idle keep-alive connections give their pool thread back
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        svc = self.server.service
+        route = urlparse(self.path).path
+        if route == "/health":
+            self._send(200, {"ok": True, "tracks": len(svc.ids)})
+        elif route == "/stats":
+            self._send(200, svc.stats.snapshot())
+        else:
+            self._send(404, {"error": f"unknown endpoint {route}"})
+
+    def do_POST(self):
+        svc = self.server.service
+        route = urlparse(self.path).path
+        t0 = time.perf_counter()
+        code = 200
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(n) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("request body must be a JSON object")
+            if route == "/similar":
+                out = svc.query(body)
+            elif route == "/similar/filtered":
+                out = svc.query(dict(body, filtered=True))
+            elif route == "/batch":
+                queries = body.get("queries", [])
+                if not isinstance(queries, list):
+                    raise ValueError("queries must be a list")
+                out = {"responses": svc.query_batch(queries)}
+            else:
+                code, out = 404, {"error": f"unknown endpoint {route}"}
+        except KeyError as e:
+            code, out = 404, {"error": str(e).strip("'\"")}
+        except (ValueError, TypeError) as e:
+            code, out = 400, {"error": str(e)}
+        except Exception as e:
+            code, out = 500, {"error": f"{type(e).__name__}: {e}"}
+        self._send(code, out)
+        # one bucket for unknown paths keeps the counters bounded
+        svc.stats.record(route if route in POST_ROUTES else "unknown", time.perf_counter() - t0, ok=code == 200)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 16,
+          max_batch: int = 64, wait_ms: float = 2.0, default_k: int = 25, sample_rate: int = 22050):
+    service = QueryService(max_batch=max_batch, wait_ms=wait_ms, default_k=default_k,
+                           sample_rate=sample_rate)
+    httpd = PooledHTTPServer((host, port), QueryHandler, service, workers=workers)
+    print(f"Serving {len(service.ids)} tracks on http://{host}:{port} ({workers} workers)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
@@ -0,0 +1,287 @@
+import os, json, time, uuid, shutil, socket, sqlite3, threading
+from typing import Dict, List, Optional
+from .features import feature_fingerprint
+from .indexer import DATA_DIR, FEAT_DIR, DB_PATH, plan_features, extract_track, record_feature_job
+
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
+MANIFEST_PATH = os.path.join(SHARD_DIR, "manifest.json")
+
+# Per shard ``shard-NNNN`` the shard directory holds:
+#   .json     the work list [[tid, path, prior_attempts], ...]
+#   .lease.N  owner info for lease generation N; its mtime is the heartbeat
+#   .out/     shard-local .npy files and results-gN.jsonl per lease generation
+#   .done     extraction finished
+#   .merged   results folded into the catalog and feature store
+
+
+def _shard_path(name: str, ext: str) -> str:
+    return os.path.join(SHARD_DIR, name + ext)
+
+
+def _list_shards() -> List[str]:
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted(f[:-5] for f in os.listdir(SHARD_DIR) if f.startswith("shard-") and f.endswith(".json"))
+
+
+def load_manifest() -> Optional[Dict]:
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    return json.load(open(MANIFEST_PATH))
+
+
+def write_manifest(sr: int=22050, sec: int=30, shard_size: int=500,
+                   max_attempts: int=3, retry_failed: bool=False) -> Dict:
+    """Split pending track ids into shard files that workers can claim."""
+    pending = [s for s in _list_shards() if not os.path.exists(_shard_path(s, ".merged"))]
+    if pending:
+        raise RuntimeError(f"{len(pending)} shards are not merged yet; run the merge step "
+                           f"or remove {SHARD_DIR} first")
+    if os.path.isdir(SHARD_DIR):
+        shutil.rmtree(SHARD_DIR)
+    os.makedirs(SHARD_DIR)
+
+    todo, total = plan_features(sr, sec, max_attempts, retry_failed)
+    shards = []
+    for n, i in enumerate(range(0, len(todo), shard_size)):
+        name = f"shard-{n:04d}"
+        json.dump([list(t) for t in todo[i:i + shard_size]], open(_shard_path(name, ".json"), "w"))
+        shards.append(name)
+    manifest = dict(created_at=time.time(), sample_rate=sr, duration_sec=sec,
+                    fingerprint=feature_fingerprint(sr, sec), total=total,
+                    pending=len(todo), shard_size=shard_size, shards=shards)
+    tmp = MANIFEST_PATH + ".tmp"
+    json.dump(manifest, open(tmp, "w"), indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+    return manifest
+
+
+class Lease:
+    """Exclusive claim on a shard, kept alive by touching the lease file.
+
+    Leases are generation-numbered files ``.lease.N``. A worker claims the
+    next generation with ``O_CREAT | O_EXCL``, so exactly one claimant wins:
+    generation 1 for a fresh shard, or ``N+1`` once lease ``N`` has not been
+    heartbeated for ``lease_sec``. A lease stays owned while its file holds
+    our random token and no later generation exists.
+    """
+
+    def __init__(self, name: str, worker: str, lease_sec: float=120.0):
+        self.name = name
+        self.base = _shard_path(name, ".lease")
+        self.worker = worker
+        self.lease_sec = lease_sec
+        self.gen = None
+        self.token = None
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self) -> str:
+        return f"{self.base}.{self.gen}"
+
+    def current_gen(self) -> int:
+        prefix = os.path.basename(self.base) + "."
+        gens = [int(f[len(prefix):]) for f in os.listdir(SHARD_DIR)
+                if f.startswith(prefix) and f[len(prefix):].isdigit()]
+        return max(gens, default=0)
+
+    def _claim(self, gen: int) -> bool:
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(f"{self.base}.{gen}", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        info = dict(worker=self.worker, token=token, host=socket.gethostname(),
+                    pid=os.getpid(), claimed_at=time.time())
+        with os.fdopen(fd, "w") as fh:
+            json.dump(info, fh)
+        self.gen, self.token = gen, token
+        return True
+
+    def acquire(self) -> bool:
+        gen = self.current_gen()
+        if gen:
+            try:
+                age = time.time() - os.stat(f"{self.base}.{gen}").st_mtime
+            except FileNotFoundError:
+                return False
+            if age <= self.lease_sec:
+                return False
+        return self._claim(gen + 1)
+
+    def owned(self) -> bool:
+        if self.gen is None or os.path.exists(f"{self.base}.{self.gen + 1}"):
+            return False
+        try:
+            return json.load(open(self.path)).get("token") == self.token
+        except (OSError, ValueError):
+            return False
+
+    def _beat(self):
+        interval = max(self.lease_sec / 4.0, 0.5)
+        while not self._stop.wait(interval):
+            try:
+                if not self.owned():
+                    raise FileNotFoundError(self.path)
+                os.utime(self.path, None)
+            except FileNotFoundError:
+                self.lost.set()
+                return
+
+    def start(self):
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+
+    def release(self):
+        """Stop heartbeating and mark the lease expired so it can be reclaimed at once."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.owned():
+            os.utime(self.path, (0, 0))
+
+
+def _read_results(out_dir: str) -> Dict[str, Dict]:
+    done = {}
+    if not os.path.isdir(out_dir):
+        return done
+    files = sorted((f for f in os.listdir(out_dir) if f.startswith("results-g") and f.endswith(".jsonl")),
+                   key=lambda f: int(f[len("results-g"):-len(".jsonl")]))
+    for f in files:
+        for line in open(os.path.join(out_dir, f)):
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crashed worker
+            done[r["id"]] = r
+    return done
+
+
+def _process_shard(name: str, manifest: Dict, lease: Lease, verbose: bool=True) -> bool:
+    out_dir = _shard_path(name, ".out")
+    os.makedirs(out_dir, exist_ok=True)
+    done = _read_results(out_dir)  # resume a reclaimed shard
+    work = json.load(open(_shard_path(name, ".json")))
+    sr, sec = manifest["sample_rate"], manifest["duration_sec"]
+    # each lease generation writes its own results file and vectors, so a
+    # worker that has not yet noticed it was superseded cannot clobber them
+    with open(os.path.join(out_dir, f"results-g{lease.gen}.jsonl"), "a") as fh:
+        for tid, path, attempts in work:
+            if tid in done:
+                continue
+            if lease.lost.is_set() or not lease.owned():
+                if verbose:
+                    print(f"[{lease.worker}] lost lease on {name}, abandoning")
+                return False
+            fname = f"{tid}-g{lease.gen}.npy"
+            res = extract_track(path, os.path.join(out_dir, fname), sr=sr, sec=sec)
+            fh.write(json.dumps(dict(res, id=tid, attempts=attempts + 1, file=fname)) + "\n")
+            fh.flush()
+    if not lease.owned():
+        return False
+    open(_shard_path(name, ".done"), "w").close()
+    if verbose:
+        print(f"[{lease.worker}] finished {name} ({len(work)} tracks)")
+    return True
+
+
+def run_worker(worker: Optional[str]=None, lease_sec: float=120.0, poll_sec: float=5.0,
+               wait: bool=True, verbose: bool=True) -> int:
+    """Claim and process shards until none are left; returns shards completed.
+
+    With ``wait`` the worker keeps polling while other workers still hold
+    leases, so it can pick up shards whose owner crashes.
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    manifest = load_manifest()
+    if manifest is None:
+        raise RuntimeError(f"No manifest at {MANIFEST_PATH}; write one first")
+    completed = 0
+    while True:
+        open_shards = [s for s in manifest["shards"] if not os.path.exists(_shard_path(s, ".done"))]
+        if not open_shards:
+            return completed
+        claimed = False
+        for name in open_shards:
+            lease = Lease(name, worker, lease_sec=lease_sec)
+            if not lease.acquire():
+                continue
+            claimed = True
+            lease.start()
+            try:
+                if os.path.exists(_shard_path(name, ".done")):
+                    continue
+                completed += int(_process_shard(name, manifest, lease, verbose=verbose))
+            finally:
+                lease.release()
+        if not claimed:
+            if not wait:
+                return completed
+            time.sleep(poll_sec)
+
+
+def run_local_workers(processes: int, lease_sec: float=120.0) -> int:
+    """Run several worker processes on this machine and wait for them."""
+    from multiprocessing import Pool
+    with Pool(processes) as pool:
+        # default worker ids are host-pid, unique across concurrent runs
+        res = [pool.apply_async(run_worker, kwds=dict(lease_sec=lease_sec)) for _ in range(processes)]
+        return sum(r.get() for r in res)
+
+
+def _leased(name: str, lease_sec: float=120.0) -> bool:
+    lease = Lease(name, "status", lease_sec=lease_sec)
+    gen = lease.current_gen()
+    try:
+        return gen > 0 and time.time() - os.stat(f"{lease.base}.{gen}").st_mtime <= lease.lease_sec
+    except FileNotFoundError:
+        return False
+
+
+def shard_status(lease_sec: float=120.0) -> Dict[str, int]:
+    manifest = load_manifest()
+    shards = manifest["shards"] if manifest else []
+    st = dict(shards=len(shards), merged=0, done=0, leased=0, open=0)
+    for s in shards:
+        if os.path.exists(_shard_path(s, ".merged")): st["merged"] += 1
+        elif os.path.exists(_shard_path(s, ".done")): st["done"] += 1
+        elif _leased(s, lease_sec): st["leased"] += 1
+        else: st["open"] += 1
+    return st
+
+
+def merge_shards(verbose: bool=True) -> Dict[str, int]:
+    """Fold finished shards into the feature store and job table."""
+    manifest = load_manifest()
+    if manifest is None:
+        raise RuntimeError(f"No manifest at {MANIFEST_PATH}; nothing to merge")
+    fp = manifest["fingerprint"]
+    os.makedirs(FEAT_DIR, exist_ok=True)
+    stats = dict(shards=0, unfinished=0, ok=0, short=0, error=0)
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    for name in manifest["shards"]:
+        if os.path.exists(_shard_path(name, ".merged")):
+            continue
+        if not os.path.exists(_shard_path(name, ".done")):
+            stats["unfinished"] += 1
+            continue
+        out_dir = _shard_path(name, ".out")
+        for tid, res in _read_results(out_dir).items():
+            src = os.path.join(out_dir, res.get("file", f"{tid}.npy"))
+            if res["status"] == "ok" and not os.path.exists(src):
+                continue  # already moved by an interrupted merge
+            if res["status"] == "ok":
+                shutil.move(src, os.path.join(FEAT_DIR, f"{tid}.npy"))
+            record_feature_job(c, tid, res, res["attempts"], fp)
+            stats[res["status"]] += 1
+        conn.commit()
+        open(_shard_path(name, ".merged"), "w").close()
+        shutil.rmtree(out_dir, ignore_errors=True)
+        stats["shards"] += 1
+    conn.close()
+    if verbose and stats["unfinished"]:
+        print(f"{stats['unfinished']} shards still running or unclaimed; merge again later.")
+    return stats
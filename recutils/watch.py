@@ -0,0 +1,256 @@
+import os, time, sqlite3, threading
+from typing import Dict, Iterable, Set, Tuple
+from .features import AUDIO_EXTS, track_id, read_tags, walk_music_dir, feature_fingerprint
+from .dupes import update_duplicates
+from .indexer import (DB_PATH, FEAT_DIR, INDEX_PATH, ensure_db, extract_track, record_feature_job,
+                      forget_tracks, build_faiss_index, add_to_index, clear_index)
+
+
+def scan_library(music_dir: str) -> Dict[str, Tuple[float, int]]:
+    """Snapshot ``{path: (mtime, size)}`` of every audio file, via os.scandir."""
+    snap = {}
+    stack = [music_dir]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.name.lower().endswith(AUDIO_EXTS):
+                        st = e.stat()
+                        snap[e.path] = (st.st_mtime, st.st_size)
+                except OSError:
+                    continue
+    return snap
+
+
+def diff_snapshots(old: Dict, new: Dict) -> Set[str]:
+    changed = {p for p, sig in new.items() if old.get(p) != sig}
+    changed.update(p for p in old if p not in new)
+    return changed
+
+
+def catalog_snapshot() -> Dict[str, Tuple[float, int]]:
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT path, mtime, size FROM tracks").fetchall()
+    conn.close()
+    return {p: (mt, sz) for p, mt, sz in rows}
+
+
+def apply_changes(paths: Iterable[str], sr: int=22050, sec: int=30, hnsw_m: int=32, ef_c: int=200,
+                  dupe_similarity: float=0.995, dupe_duration_tol: float=2.0) -> Dict[str, int]:
+    """Push changed paths through cataloging, extraction, index and duplicate updates.
+
+    Paths may be files or directories; anything that no longer exists is
+    removed from the catalog. New tracks are appended to the index; removals
+    or modified tracks need a rebuild because HNSW cannot delete rows.
+    Duplicate groups are re-clustered around the changed tracks only.
+    """
+    ensure_db()
+    os.makedirs(FEAT_DIR, exist_ok=True)
+    fp = feature_fingerprint(sr, sec)
+    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
+
+    files, gone = set(), set()
+    for p in paths:
+        if os.path.isdir(p):
+            files.update(walk_music_dir(p))
+        elif os.path.isfile(p):
+            if p.lower().endswith(AUDIO_EXTS):
+                files.add(p)
+        else:
+            prefix = p.rstrip(os.sep) + os.sep
+            rows = c.execute("SELECT id FROM tracks WHERE path=? OR substr(path, 1, ?)=?",
+                             (p, len(prefix), prefix)).fetchall()
+            gone.update(r[0] for r in rows)
+
+    added, modified = [], []
+    for p in sorted(files):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        tid = track_id(p)
+        row = c.execute("SELECT mtime, size FROM tracks WHERE id=?", (tid,)).fetchone()
+        if row is not None and (row[0], row[1]) == (st.st_mtime, st.st_size):
+            continue
+        tags = read_tags(p)
+        if row is None:
+            c.execute("""INSERT INTO tracks(id,path,title,artist,album,year,genre,duration,stars,bpm,key,camelot,mtime,size)
+            VALUES(?,?,?,?,?,?,?,?,NULL,NULL,NULL,NULL,?,?)""",
+            (tid, p, tags["title"], tags["artist"], tags["album"], tags["year"],
+             tags["genre"], tags["duration"], st.st_mtime, st.st_size))
+            added.append(tid)
+        else:
+            c.execute("""UPDATE tracks SET title=?, artist=?, album=?, year=?, genre=?, duration=?, mtime=?, size=?
+            WHERE id=?""", (tags["title"], tags["artist"], tags["album"], tags["year"],
+                            tags["genre"], tags["duration"], st.st_mtime, st.st_size, tid))
+            modified.append(tid)
+        res = extract_track(p, os.path.join(FEAT_DIR, f"{tid}.npy"), sr=sr, sec=sec)
+        record_feature_job(c, tid, res, 1, fp)
+        conn.commit()
+    conn.close()
+
+    if gone:
+        forget_tracks(sorted(gone))
+    # e.g. a fresh library whose only file is too short, or every track deleted
+    has_vectors = any(f.endswith(".npy") for f in os.listdir(FEAT_DIR))
+    if not (added or modified or gone):
+        rows = 0
+    elif not has_vectors:
+        rows = clear_index()
+    elif gone or modified or not os.path.exists(INDEX_PATH):
+        rows = build_faiss_index(hnsw_m=hnsw_m, ef_c=ef_c, sample_rate=sr)
+    else:
+        rows = add_to_index(added)
+    groups = 0
+    if has_vectors and (added or modified or gone):
+        groups = update_duplicates(added + modified, gone, min_similarity=dupe_similarity,
+                                   duration_tol=dupe_duration_tol)["groups"]
+    return dict(added=len(added), modified=len(modified), removed=len(gone), index_rows=rows,
+                dupe_groups=groups)
+
+
+class LibraryWatcher:
+    """Collect file changes under ``music_dir`` and apply them in debounced batches.
+
+    Uses inotify through the optional ``watchdog`` package when available and
+    falls back to polling ``scan_library`` every ``poll_sec``. A batch is
+    flushed once the library has been quiet for ``debounce_sec`` or changes
+    have been pending for ``max_wait_sec``; files written within the last
+    ``debounce_sec`` are held back so half-copied files are not decoded.
+    """
+
+    def __init__(self, music_dir: str, sr: int=22050, sec: int=30, hnsw_m: int=32, ef_c: int=200,
+                 debounce_sec: float=5.0, max_wait_sec: float=30.0, poll_sec: float=10.0,
+                 use_inotify: bool=True, dupe_similarity: float=0.995, dupe_duration_tol: float=2.0):
+        self.music_dir = music_dir  # as cataloged, so paths match track ids
+        self.params = dict(sr=sr, sec=sec, hnsw_m=hnsw_m, ef_c=ef_c, dupe_similarity=dupe_similarity,
+                           dupe_duration_tol=dupe_duration_tol)
+        self.debounce_sec = debounce_sec
+        self.max_wait_sec = max_wait_sec
+        self.poll_sec = poll_sec
+        self.use_inotify = use_inotify
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.first_event = self.last_event = 0.0
+        self._snapshot = {}
+
+    def mark(self, paths: Iterable[str]):
+        now = time.time()
+        with self.lock:
+            if not self.dirty:
+                self.first_event = now
+            self.dirty.update(paths)
+            self.last_event = now
+
+    def _observer(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory and event.event_type == "modified":
+                    return
+                paths = [event.src_path, getattr(event, "dest_path", None)]
+                watcher.mark(p for p in paths
+                             if p and (event.is_directory or p.lower().endswith(AUDIO_EXTS)))
+
+        obs = Observer()
+        obs.schedule(_Handler(), self.music_dir, recursive=True)
+        obs.start()
+        return obs
+
+    def _poll(self):
+        snap = scan_library(self.music_dir)
+        changed = diff_snapshots(self._snapshot, snap)
+        self._snapshot = snap
+        if changed:
+            self.mark(changed)
+
+    def _take_batch(self):
+        now = time.time()
+        with self.lock:
+            if not self.dirty:
+                return []
+            quiet = now - self.last_event >= self.debounce_sec
+            overdue = now - self.first_event >= self.max_wait_sec
+            if not (quiet or overdue):
+                return []
+            ready, held = [], set()
+            for p in self.dirty:
+                try:
+                    fresh = now - os.stat(p).st_mtime < self.debounce_sec and not os.path.isdir(p)
+                except OSError:
+                    fresh = False
+                if fresh:
+                    held.add(p)
+                else:
+                    ready.append(p)
+            self.dirty = held
+            if held:
+                self.first_event = self.last_event = now
+            return ready
+
+    def reconcile(self):
+        """Queue everything that differs between the disk and the catalog."""
+        ensure_db()
+        self._snapshot = scan_library(self.music_dir)
+        known = catalog_snapshot()
+        # rows cataloged before mtime/size were stored: adopt the disk state
+        baseline = [(sig[0], sig[1], p) for p, sig in self._snapshot.items()
+                    if p in known and known[p] == (None, None)]
+        if baseline:
+            conn = sqlite3.connect(DB_PATH)
+            conn.executemany("UPDATE tracks SET mtime=?, size=? WHERE path=?", baseline)
+            conn.commit(); conn.close()
+            known.update({p: (mt, sz) for mt, sz, p in baseline})
+        root = self.music_dir.rstrip(os.sep) + os.sep
+        known = {p: sig for p, sig in known.items() if p.startswith(root)}
+        changed = diff_snapshots(known, self._snapshot)
+        if changed:
+            self.mark(changed)
+        return len(changed)
+
+    def flush(self) -> bool:
+        batch = self._take_batch()
+        if not batch:
+            return False
+        t0 = time.time()
+        try:
+            stats = apply_changes(batch, **self.params)
+        except Exception as e:
+            # keep watching; the batch is retried after the next debounce
+            print(f"[watch] failed to apply {len(batch)} changes, will retry: {type(e).__name__}: {e}")
+            self.mark(batch)
+            return False
+        print(f"[watch] {stats['added']} added, {stats['modified']} modified, {stats['removed']} removed; "
+              f"index updated ({stats['index_rows']} rows, {stats['dupe_groups']} duplicate groups touched) in {time.time() - t0:.1f}s")
+        return True
+
+    def run(self):
+        n = self.reconcile()
+        print(f"[watch] {n} changes since the last build")
+        obs = self._observer() if self.use_inotify else None
+        print(f"[watch] watching {self.music_dir} ({'inotify' if obs else f'polling every {self.poll_sec:g}s'})")
+        next_poll = time.time() + self.poll_sec
+        try:
+            while True:
+                time.sleep(0.5)
+                if obs is None and time.time() >= next_poll:
+                    self._poll()
+                    next_poll = time.time() + self.poll_sec
+                self.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if obs is not None:
+                obs.stop(); obs.join()
@@ -0,0 +1,27 @@
+import argparse, yaml, os
+from recutils.service import serve
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local JSON query service over the FAISS index.")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=16,
+                    help="HTTP worker threads; each keep-alive client holds one")
+    ap.add_argument("--max-batch", type=int, default=64, help="max query rows per FAISS search")
+    ap.add_argument("--batch-wait-ms", type=float, default=2.0,
+                    help="how long to wait for more queries to coalesce (0 = only what is queued)")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open(args.config)) if os.path.exists(args.config) \
+        else yaml.safe_load(open("config.example.yaml"))
+
+    serve(host=args.host, port=args.port, workers=args.workers,
+          max_batch=args.max_batch, wait_ms=args.batch_wait_ms,
+          default_k=int(cfg.get("neighbors_k", 25)),
+          sample_rate=int(cfg.get("sample_rate", 22050)))
+
+
+if __name__ == "__main__":
+    main()